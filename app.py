@@ -7,83 +7,236 @@ Fuente datos:
 - Estadísticas de Riesgos Laborales Positiva 2024
 """
 
+import os
+import math
 import warnings
 import geopandas as gpd
+import shapely
 import pandas as pd
-import numpy as np
-import json
+import orjson
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 
 warnings.filterwarnings("ignore")
 
+# Serializar figuras con orjson (orjson ya es dependencia): sin depender de
+# la detección automática de plotly ni caer en silencio al módulo json
+pio.json.config.default_engine = "orjson"
+
 # =======================
-# 1. Cargar datos
+# 1. Rutas de datos
 # =======================
-shapefile_path = "data/COLOMBIA/COLOMBIA.shp"
+# Geometría ya simplificada, generada con scripts/build_geojson.py
+geojson_path = "data/colombia_simplified.geojson"
 csv_path = "data/Estadísticas_Riesgos_Laborales_Positiva_2024_20250912.csv"
 
-# Cargar shapefile y CSV
-gdf = gpd.read_file(shapefile_path, encoding="utf-8")
-df = pd.read_csv(csv_path, encoding="utf-8")
-
 # =======================
 # 2. Preprocesamiento
 # =======================
 def sum_por_departamento(df, column_name):
-    return df.groupby("DPTO_CNMBR")[column_name].sum().reset_index()
-
-df_sum = sum_por_departamento(df, "MUERTES_REPOR_AT")
-
-# Reemplazar inconsistencias de nombres
-df_sum["DPTO_CNMBR"].replace({
-    "N. DE SANTANDER": "NORTE SANTANDER",
-    "VALLE DEL CAUCA": "VALLE"
-}, inplace=True)
-
-gdf["DPTO_CNMBR"].replace({
-    "NARI?O": "NARIÑO",
-    "NORTE DE SANTANDER": "NORTE SANTANDER",
-    "BOGOTA D.C.": "BOGOTA",
-    "ARCHIPIELAGO DE SAN ANDRES": "SAN ANDRES",
-    "VALLE DEL CAUCA": "VALLE"
-}, inplace=True)
-
-# Normalizar tildes
-mal_car = ['á', 'é', 'í', 'ó', 'ú', 'ñ', 'ü']
-bien_car = ['a', 'e', 'i', 'o', 'u', 'n', 'u']
-
-def normalizar_texto(s):
-    if pd.isna(s):
-        return s
-    s = s.lower()
-    for i in range(len(mal_car)):
-        s = s.replace(mal_car[i], bien_car[i])
-    return s
-
-df_sum["DPTO_CNMBR"] = df_sum["DPTO_CNMBR"].apply(normalizar_texto)
-gdf["DPTO_CNMBR"] = gdf["DPTO_CNMBR"].apply(normalizar_texto)
-
-# Merge
-Datos_tot = pd.merge(gdf, df_sum, on="DPTO_CNMBR", how="outer")
-
-# Simplificar geometría para Render
-gdf_simplificado = gdf.copy()
-gdf_simplificado["geometry"] = gdf_simplificado["geometry"].simplify(0.01, preserve_topology=True)
-geojson = json.loads(gdf_simplificado.to_json())
+    return df.groupby("DPTO_CNMBR", observed=True)[column_name].sum().reset_index()
+
+# Nombres canónicos para que CSV y shapefile coincidan (claves ya normalizadas)
+NOMBRES_CANONICOS = {
+    "n. de santander": "norte santander",
+    "norte de santander": "norte santander",
+    "valle del cauca": "valle",
+    "nari?o": "narino",
+    "bogota d.c.": "bogota",
+    "archipielago de san andres": "san andres"
+}
+
+# Normalizar tildes: NFKD separa las marcas diacríticas (\p{Mn}) y se eliminan
+# en una sola operación columnar sobre el arreglo de Arrow. Luego se aplican
+# los nombres canónicos en una sola pasada
+def normalizar_texto(serie):
+    normalizado = (
+        serie.astype("string[pyarrow]")
+        .str.normalize("NFKD")
+        .str.replace(r"\p{Mn}", "", regex=True)
+        .str.lower()
+    )
+    return normalizado.map(NOMBRES_CANONICOS).fillna(normalizado)
+
+def preprocesar():
+    # Cargar geometría y CSV
+    with open(geojson_path, "rb") as f:
+        geojson = orjson.loads(f.read())
+    gdf = gpd.GeoDataFrame.from_features(geojson["features"], crs="EPSG:4326")
+    # Del CSV solo se usan dos columnas; el motor pyarrow parsea en paralelo
+    df = pd.read_csv(
+        csv_path,
+        encoding="utf-8",
+        engine="pyarrow",
+        dtype_backend="pyarrow",
+        usecols=["DPTO_CNMBR", "MUERTES_REPOR_AT"],
+        dtype={"DPTO_CNMBR": "category", "MUERTES_REPOR_AT": "int32"}
+    )
+
+    df_sum = sum_por_departamento(df, "MUERTES_REPOR_AT")
+
+    # Normalizar nombres y unificar inconsistencias entre ambas fuentes
+    df_sum["DPTO_CNMBR"] = normalizar_texto(df_sum["DPTO_CNMBR"])
+    gdf["DPTO_CNMBR"] = normalizar_texto(gdf["DPTO_CNMBR"])
+
+    # Mismas categorías en ambos lados: el join compara códigos enteros
+    deptos = pd.CategoricalDtype(sorted(set(df_sum["DPTO_CNMBR"]) | set(gdf["DPTO_CNMBR"])))
+    df_sum["DPTO_CNMBR"] = df_sum["DPTO_CNMBR"].astype(deptos)
+    gdf["DPTO_CNMBR"] = gdf["DPTO_CNMBR"].astype(deptos)
+
+    # Join por índice sobre el nombre normalizado; solo interesan los
+    # departamentos con geometría y cada nombre debe aparecer una vez
+    df_sum = df_sum.astype({"MUERTES_REPOR_AT": "int32"})
+    Datos_tot = (
+        gdf.set_index("DPTO_CNMBR")
+        .join(df_sum.set_index("DPTO_CNMBR"), how="left", validate="1:1")
+        .reset_index()
+    )
+    # Departamentos sin reportes en el CSV: cero muertes, manteniendo el tipo entero
+    Datos_tot["MUERTES_REPOR_AT"] = Datos_tot["MUERTES_REPOR_AT"].fillna(0).astype("int32")
+
+    # Centroides en una sola llamada a GEOS sobre el arreglo de geometrías
+    # (NaN donde no hay geometría)
+    centroides = shapely.centroid(Datos_tot.geometry.values)
+    Datos_tot["lon"] = shapely.get_x(centroides)
+    Datos_tot["lat"] = shapely.get_y(centroides)
+
+    # Propagar los nombres normalizados a las propiedades del GeoJSON
+    for feature, nombre in zip(geojson["features"], gdf["DPTO_CNMBR"]):
+        feature["properties"]["DPTO_CNMBR"] = nombre
+
+    return df_sum, Datos_tot, geojson
+
+# Con el GeoJSON ya simplificado el preprocesamiento tarda unos milisegundos:
+# se hace en memoria al arrancar, sin caché en disco ni permisos de escritura
+df_sum, Datos_tot, geojson = preprocesar()
 
 # Preparar datos para el top 10
 top_10 = df_sum.nlargest(10, 'MUERTES_REPOR_AT').copy()
 top_10['DPTO_CNMBR'] = top_10['DPTO_CNMBR'].str.title()
 
+# Departamento resaltado al cargar la página. El marcador y el gráfico de
+# barras los construye solo el callback del navegador, también en la carga
+DEPTO_INICIAL = "bogota"
+
+con_geometria = Datos_tot[Datos_tot["lon"].notna()]
+CENTROIDES = dict(zip(con_geometria["DPTO_CNMBR"], zip(con_geometria["lon"], con_geometria["lat"])))
+
+# Etiqueta legible de cada departamento, formateada una sola vez (las
+# categorías son la unión de nombres del CSV y del GeoJSON)
+nombres = df_sum["DPTO_CNMBR"].cat.categories
+ETIQUETAS = dict(zip(nombres, nombres.str.title()))
+
+# El choropleth solo depende de datos estáticos: se envía una sola vez en el
+# layout y el callback solo modifica la traza del marcador (índice 1).
+# La vista inicial se ajusta a la extensión de los departamentos
+oeste, sur, este, norte = Datos_tot.total_bounds
+
+ALTO_MAPA = 550
+MARGEN_MAPA = {"l": 0, "r": 0, "t": 40, "b": 0}
+
+def mercator_y(lat):
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+def vista_ajustada(oeste, sur, este, norte, alto, relleno=0.9):
+    # MapLibre (Mercator) mide 512 px de lado en zoom 0. Se elige el zoom con
+    # el que la extensión cabe en el alto útil; se asume un área al menos tan
+    # ancha como alta, y Colombia es más alta que ancha en Mercator
+    alto_util = alto - MARGEN_MAPA["t"] - MARGEN_MAPA["b"]
+    fraccion_x = (este - oeste) / 360
+    fraccion_y = (mercator_y(norte) - mercator_y(sur)) / (2 * math.pi)
+    zoom = math.log2(relleno * alto_util / (512 * max(fraccion_x, fraccion_y)))
+    # Centro en coordenadas Mercator para que el margen norte y sur sea igual
+    y_centro = (mercator_y(norte) + mercator_y(sur)) / 2
+    lat_centro = math.degrees(2 * math.atan(math.exp(y_centro)) - math.pi / 2)
+    return {"lat": lat_centro, "lon": (oeste + este) / 2}, zoom
+
+centro_mapa, zoom_mapa = vista_ajustada(oeste, sur, este, norte, ALTO_MAPA)
+BASE_MAPA = px.choropleth_map(
+    Datos_tot,
+    geojson=geojson,
+    locations="DPTO_CNMBR",
+    featureidkey="properties.DPTO_CNMBR",
+    color="MUERTES_REPOR_AT",
+    hover_name=Datos_tot["DPTO_CNMBR"].map(ETIQUETAS).to_numpy(),
+    color_continuous_scale="Reds",
+    title="Muertes por Accidentes de Trabajo en Colombia",
+    # Render WebGL (MapLibre) sin teselas de fondo: solo los polígonos
+    map_style="white-bg",
+    center=centro_mapa,
+    zoom=zoom_mapa,
+    height=ALTO_MAPA
+)
+BASE_MAPA.update_layout(margin=MARGEN_MAPA)
+# Traza del marcador vacía: la llena el callback del navegador
+BASE_MAPA.add_scattermap(
+    lon=[],
+    lat=[],
+    text=[],
+    mode="markers+text",
+    marker=dict(size=12, color="blue"),
+    textposition="top center"
+)
+# Ya serializada: Dash vuelve a serializar el layout en cada carga de página
+FIGURA_MAPA = orjson.loads(BASE_MAPA.to_json())
+
+# Muertes por departamento y gráfico de barras base: solo cambian x, y, texto
+# y título, sin filtrar df_sum ni pasar por plotly express
+MUERTES_POR_DEPTO = dict(zip(df_sum["DPTO_CNMBR"], df_sum["MUERTES_REPOR_AT"].tolist()))
+TOTAL_MUERTES = sum(MUERTES_POR_DEPTO.values())
+
+BASE_BARRAS = go.Figure(
+    go.Bar(
+        x=[None],
+        y=[None],
+        marker_color='#e74c3c',
+        textposition='outside',
+        hovertemplate="Departamento=%{x}<br>Número de muertes=%{y}<extra></extra>"
+    )
+)
+BASE_BARRAS.update_layout(
+    xaxis_title="",
+    yaxis_title="Número de Muertes",
+    showlegend=False
+)
+
+# Datos que usan los callbacks del navegador: un registro por departamento
+# (etiqueta, muertes y centroide) y la plantilla ya serializada del gráfico
+DATOS_DEPTO = {
+    "deptos": {
+        depto: {
+            "label": ETIQUETAS[depto],
+            "muertes": muertes,
+            "lon": CENTROIDES.get(depto, (None, None))[0],
+            "lat": CENTROIDES.get(depto, (None, None))[1],
+        }
+        for depto, muertes in MUERTES_POR_DEPTO.items()
+    },
+    "barras": orjson.loads(BASE_BARRAS.to_json()),
+}
+
+# Opciones del dropdown: las categorías del nombre ya están ordenadas y son la
+# única fuente de verdad; solo se listan departamentos con datos y la etiqueta
+# se toma de depto-store para no formatearla dos veces
+OPCIONES_DEPTO = [
+    {"label": DATOS_DEPTO["deptos"][d]["label"], "value": d}
+    for d in df_sum["DPTO_CNMBR"].cat.categories
+    if d in DATOS_DEPTO["deptos"]
+]
+
 # =======================
 # 3. Inicializar app
 # =======================
-app = dash.Dash(__name__)
+# compress=True (flask-compress) comprime con gzip/br las respuestas, sobre todo
+# el layout que lleva el GeoJSON del mapa
+app = dash.Dash(__name__, compress=True)
 server = app.server   # necesario para Render
+# Fijados explícitamente: nivel gzip medio y sin comprimir respuestas diminutas
+server.config.update(COMPRESS_LEVEL=6, COMPRESS_MIN_SIZE=500)
 
 # =======================
 # 4. Layout
@@ -160,12 +313,12 @@ app.layout = html.Div([
     # Estadísticas principales
     html.Div([
         html.Div([
-            html.H2("10,361", style={"fontSize": "2.5em", "margin": "0", "color": "#e74c3c"}),
+            html.H2(f"{TOTAL_MUERTES:,}", style={"fontSize": "2.5em", "margin": "0", "color": "#e74c3c"}),
             html.P("Total de Muertes Reportadas", style={"margin": "0", "fontWeight": "bold"})
         ], style={"textAlign": "center", "padding": "15px", "backgroundColor": "#f9f9f9", "borderRadius": "5px", "flex": "1", "margin": "0 10px"}),
         
         html.Div([
-            html.H2("33", style={"fontSize": "2.5em", "margin": "0", "color": "#3498db"}),
+            html.H2(str(len(MUERTES_POR_DEPTO)), style={"fontSize": "2.5em", "margin": "0", "color": "#3498db"}),
             html.P("Departamentos Analizados", style={"margin": "0", "fontWeight": "bold"})
         ], style={"textAlign": "center", "padding": "15px", "backgroundColor": "#f9f9f9", "borderRadius": "5px", "flex": "1", "margin": "0 10px"})
     ], style={"display": "flex", "justifyContent": "center", "marginBottom": "20px"}),
@@ -175,17 +328,18 @@ app.layout = html.Div([
         html.Label("Selecciona un departamento:", style={"fontWeight": "bold", "marginBottom": "5px"}),
         dcc.Dropdown(
             id="dropdown-depto",
-            options=[{"label": dept.title(), "value": dept} for dept in df_sum["DPTO_CNMBR"].unique()],
-            value="bogota",
+            options=OPCIONES_DEPTO,
+            value=DEPTO_INICIAL,
             clearable=False,
             style={"marginBottom": "20px"}
-        )
+        ),
+        dcc.Store(id="depto-store", data=DATOS_DEPTO)
     ], style={"width": "50%", "margin": "0 auto 20px"}),
     
     # Mapa y gráfico de departamento seleccionado
     html.Div([
         html.Div([
-            dcc.Graph(id="mapa-muertes")
+            dcc.Graph(id="mapa-muertes", figure=FIGURA_MAPA)
         ], style={"width": "60%", "display": "inline-block", "verticalAlign": "top"}),
         
         html.Div([
@@ -220,7 +374,8 @@ app.layout = html.Div([
 @app.callback(
     Output("acordeon-content", "style"),
     [Input("acordeon", "n_clicks")],
-    [State("acordeon-content", "style")]
+    [State("acordeon-content", "style")],
+    prevent_initial_call=True
 )
 def toggle_acordeon(n_clicks, current_style):
     if n_clicks is None:
@@ -232,74 +387,54 @@ def toggle_acordeon(n_clicks, current_style):
         return {'display': 'none', 'padding': '15px', 'border': '1px solid #ddd', 'borderTop': 'none'}
 
 
-@app.callback(
-    Output("mapa-muertes", "figure"),
-    [Input("dropdown-depto", "value")]
-)
-def actualizar_mapa(depto_seleccionado):
-    fig_mapa = px.choropleth(
-        Datos_tot,
-        geojson=geojson,
-        locations="DPTO_CNMBR",
-        featureidkey="properties.DPTO_CNMBR",
-        color="MUERTES_REPOR_AT",
-        hover_name="DPTO_CNMBR",
-        color_continuous_scale="Reds",
-        title="Muertes por Accidentes de Trabajo en Colombia"
-    )
-    fig_mapa.update_geos(fitbounds="locations", visible=False)
-
-    # Resaltar seleccionado
-    seleccionado = Datos_tot[Datos_tot["DPTO_CNMBR"] == depto_seleccionado]
-    if not seleccionado.empty:
-        centroide = seleccionado.geometry.centroid.iloc[0]
-        fig_mapa.add_scattergeo(
-            lon=[centroide.x],
-            lat=[centroide.y],
-            text=[depto_seleccionado.title()],
-            mode="markers+text",
-            marker=dict(size=12, color="blue"),
-            textposition="top center"
-        )
-    return fig_mapa
+# Marcador y gráfico de barras solo necesitan datos ya enviados en el layout
+# (depto-store): se construyen en el navegador, incluida la carga inicial,
+# sin pasar por el servidor
+app.clientside_callback(
+    """
+    function(depto, datos, figura) {
+        // Un solo registro por departamento alimenta ambas salidas
+        var fila = datos.deptos[depto];
 
+        // Resaltar seleccionado: solo cambia la traza del marcador (índice 1)
+        var conPunto = fila && fila.lon !== null;
+        var marcador = Object.assign({}, figura.data[1], {
+            lon: conPunto ? [fila.lon] : [],
+            lat: conPunto ? [fila.lat] : [],
+            text: conPunto ? [fila.label] : []
+        });
+        var data = figura.data.slice();
+        data[1] = marcador;
+        var mapa = Object.assign({}, figura, {data: data});
 
-@app.callback(
-    Output("grafico-depto", "figure"),
-    [Input("dropdown-depto", "value")]
+        var plantilla = datos.barras;
+        if (!fila) {
+            return [mapa, {data: [], layout: {
+                template: plantilla.layout.template,
+                title: {text: "Sin datos disponibles"}
+            }}];
+        }
+        var barra = Object.assign({}, plantilla.data[0], {
+            x: [depto],
+            y: [fila.muertes],
+            // Añadir el valor numérico en las barras
+            text: [fila.muertes]
+        });
+        var layout = Object.assign({}, plantilla.layout, {
+            title: {text: "Muertes reportadas en " + fila.label}
+        });
+        return [mapa, {data: [barra], layout: layout}];
+    }
+    """,
+    [Output("mapa-muertes", "figure"), Output("grafico-depto", "figure")],
+    [Input("dropdown-depto", "value")],
+    [State("depto-store", "data"), State("mapa-muertes", "figure")]
 )
-def actualizar_barras(depto_seleccionado):
-    filtro = df_sum[df_sum["DPTO_CNMBR"] == depto_seleccionado]
-    if filtro.empty:
-        return px.bar(title="Sin datos disponibles")
-    
-    # Crear gráfico de barras con estilo mejorado
-    fig = px.bar(
-        filtro,
-        x="DPTO_CNMBR",
-        y="MUERTES_REPOR_AT",
-        title=f"Muertes reportadas en {depto_seleccionado.title()}",
-        labels={"MUERTES_REPOR_AT": "Número de muertes", "DPTO_CNMBR": "Departamento"},
-        color_discrete_sequence=['#e74c3c']
-    )
-    
-    # Mejorar el diseño
-    fig.update_layout(
-        xaxis_title="",
-        yaxis_title="Número de Muertes",
-        showlegend=False
-    )
-    
-    # Añadir el valor numérico en las barras
-    fig.update_traces(
-        text=filtro['MUERTES_REPOR_AT'].values,
-        textposition='outside'
-    )
-    
-    return fig
 
 # =======================
 # 6. Run
 # =======================
+# En producción: gunicorn app:server (ver gunicorn.conf.py). El modo debug
+# recarga el módulo completo en cada cambio, así que solo se activa con DASH_DEBUG=1
 if __name__ == "__main__":
-    app.run_server(host="0.0.0.0", port=8080, debug=True)
+    app.run(host="0.0.0.0", port=8080, debug=os.environ.get("DASH_DEBUG") == "1")
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+Configuración de gunicorn (se carga sola desde el directorio de trabajo).
+
+Uso: gunicorn app:server
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# WEB_CONCURRENCY lo fija la plataforma (Render/Heroku). Por defecto pocos
+# workers: cada uno carga geopandas, plotly y las figuras, y cpu_count() da las
+# CPU del host, no la cuota del contenedor. Además los cambios de departamento
+# se resuelven en el navegador, así que el servidor casi solo sirve el layout
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = 2
+
+# Los datos y figuras se construyen una vez en el maestro antes del fork, así
+# que los workers arrancan sin repetir el preprocesamiento
+preload_app = True